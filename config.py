@@ -1,43 +1,83 @@
 import os
+from dataclasses import dataclass, field
 from dotenv import load_dotenv
-from pydantic import BaseModel
 
-# Load environment variables from .env file
-load_dotenv()
+# Load environment variables from .env file, unless the environment is
+# already complete (e.g. in containers)
+if os.getenv("DISABLE_DOTENV") != "1":
+    load_dotenv()
 
 
-class DatabaseConfig(BaseModel):
+@dataclass(slots=True, frozen=True)
+class DatabaseConfig:
     host: str
     port: int
     name: str
     user: str
-    password: str
+    password: str = field(repr=False)
     pagination_column: str
+    pool_size: int
+    max_overflow: int
+    pool_recycle: int
+    pool_min_size: int
+    statement_cache_size: int
 
 
-class APIConfig(BaseModel):
-    token: str
+@dataclass(slots=True, frozen=True)
+class APIConfig:
+    token: str = field(repr=False)
+    cursor_secret: str = field(repr=False)
+    response_cache_ttl: int
+    response_cache_max_bytes: int
 
 
+@dataclass(slots=True, frozen=True)
 class Config:
     """Application configuration."""
 
-    def __init__(self):
-        self.db = DatabaseConfig(
-            host=os.getenv("DB_HOST", "localhost"),
-            port=int(os.getenv("DB_PORT", "5432")),
-            name=os.getenv("DB_NAME", "warehouse"),
-            user=os.getenv("DB_USER", "postgres"),
-            password=os.getenv("DB_PASSWORD", ""),
-            pagination_column=os.getenv("PAGINATION_COLUMN", "id"),
+    db: DatabaseConfig
+    api: APIConfig
+    db_url: str = field(init=False, repr=False)
+
+    def __post_init__(self):
+        object.__setattr__(
+            self,
+            "db_url",
+            f"postgresql+asyncpg://{self.db.user}:{self.db.password}@{self.db.host}:{self.db.port}/{self.db.name}",
         )
 
-        self.api = APIConfig(token=os.getenv("API_TOKEN", ""))
+    @classmethod
+    def from_env(cls) -> "Config":
+        """Build the configuration from environment variables."""
+        return cls(
+            db=DatabaseConfig(
+                host=os.getenv("DB_HOST", "localhost"),
+                port=int(os.getenv("DB_PORT", "5432")),
+                name=os.getenv("DB_NAME", "warehouse"),
+                user=os.getenv("DB_USER", "postgres"),
+                password=os.getenv("DB_PASSWORD", ""),
+                pagination_column=os.getenv("PAGINATION_COLUMN", "id"),
+                pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+                max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+                pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+                pool_min_size=int(os.getenv("DB_POOL_MIN_SIZE", "5")),
+                statement_cache_size=int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500")),
+            ),
+            api=APIConfig(
+                token=os.getenv("API_TOKEN", ""),
+                cursor_secret=os.getenv("CURSOR_SECRET")
+                or os.getenv("API_TOKEN", ""),
+                response_cache_ttl=int(os.getenv("RESPONSE_CACHE_TTL", "30")),
+                response_cache_max_bytes=int(
+                    os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))
+                ),
+            ),
+        )
 
     def get_db_url(self) -> str:
         """Get the database URL for SQLAlchemy."""
-        return f"postgresql://{self.db.user}:{self.db.password}@{self.db.host}:{self.db.port}/{self.db.name}"
+        return self.db_url
 
 
 # Create a global config instance
-config = Config()
+config = Config.from_env()
@@ -1,159 +1,629 @@
-from typing import Dict, List, Optional, Tuple, Any
+import asyncio
+import base64
+import hashlib
+import hmac
+import re
+from functools import lru_cache
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+import orjson
 import sqlalchemy as sa
-from sqlalchemy.engine import Engine
-from sqlalchemy.exc import SQLAlchemyError
+from cachetools import TTLCache
+from sqlalchemy.dialects.postgresql.asyncpg import AsyncAdapt_asyncpg_dbapi
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
 from config import config
 
+# Plain PostgreSQL identifiers (at most 63 bytes) that are safe to quote
+_IDENT_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]{0,62}")
 
-def get_db_engine() -> Engine:
-    """Create and return a SQLAlchemy engine instance."""
-    return sa.create_engine(config.get_db_url())
+# Bytes of the HMAC-SHA256 tag appended to cursor tokens
+_CURSOR_TAG_SIZE = 8
 
+T = TypeVar("T")
 
-def get_table_columns(
-    engine: Engine, schema_name: str, table_name: str
-) -> List[Dict[str, Any]]:
+
+class InvalidQueryError(ValueError):
+    """Raised when request parameters can't be turned into a valid query."""
+
+
+class TableMetadata(NamedTuple):
+    """
+    Column information for a table, with lookups derived from it.
+
+    `columns` holds dicts in the shape of models.ColumnInfo and is served in
+    responses as is, so it is never validated or rebuilt per request.
+    """
+
+    columns: Tuple[Dict[str, Any], ...]
+    column_types: Dict[str, str]
+    cast_types: Dict[str, str]
+    has_district: bool
+
+
+# Recent row counts keyed by (schema, table, district filter, estimated)
+_count_cache: TTLCache = TTLCache(maxsize=1024, ttl=60)
+
+# Table metadata keyed by (schema, table); only found tables are cached so
+# newly created ones show up immediately
+_metadata_cache: TTLCache = TTLCache(maxsize=256, ttl=300)
+
+# Built once so SQLAlchemy's compiled cache can reuse it
+_COLUMNS_QUERY = sa.text(
+    """
+    SELECT column_name, data_type, is_nullable, udt_schema, udt_name
+    FROM information_schema.columns
+    WHERE table_schema = :schema_name AND table_name = :table_name
+    ORDER BY ordinal_position
+    """
+)
+
+# Planner row estimate, kept current by ANALYZE/autovacuum
+_ESTIMATE_QUERY = sa.text(
+    "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table_name)"
+)
+
+
+@lru_cache(maxsize=None)
+def get_db_engine() -> AsyncEngine:
+    """
+    Return the shared async SQLAlchemy engine.
+
+    The engine (and its connection pool) is created on first use and reused
+    by every request afterwards.
+    """
+    # Keep enough prepared statements per connection for every query shape
+    # of the tables in use
+    url = sa.make_url(config.get_db_url()).update_query_dict(
+        {"prepared_statement_cache_size": str(config.db.statement_cache_size)}
+    )
+    return create_async_engine(
+        url,
+        pool_size=config.db.pool_size,
+        max_overflow=config.db.max_overflow,
+        pool_pre_ping=True,
+        pool_recycle=config.db.pool_recycle,
+        query_cache_size=1200,
+    )
+
+
+async def warm_db_pool(size: int) -> None:
+    """
+    Open `size` pooled connections up front so the first requests don't pay
+    the connection handshake.
+
+    Args:
+        size: Number of connections to open
+
+    Raises:
+        ValueError: If a connection can't be established
+    """
+    engine = get_db_engine()
+
+    async def ping() -> None:
+        async with engine.connect() as conn:
+            await conn.execute(sa.text("SELECT 1"))
+
+    try:
+        # Connect concurrently so each ping checks out its own connection
+        await asyncio.gather(*(ping() for _ in range(size)))
+    except (SQLAlchemyError, OSError) as e:
+        raise ValueError(f"Error warming connection pool: {str(e)}")
+
+
+async def _retry_stale(run: Callable[[], Awaitable[T]]) -> T:
+    """
+    Run a query, retrying it once if it hit a stale prepared statement.
+
+    asyncpg caches prepared statements per connection, and PostgreSQL
+    rejects them once a table is rebuilt with different columns (as dbt
+    does). The dialect resets every connection's cache when that happens,
+    so the second attempt prepares the statement afresh.
+
+    Args:
+        run: Coroutine function that runs the query on its own connection
+
+    Returns:
+        The result of `run`
+    """
+    try:
+        return await run()
+    except DBAPIError as e:
+        if not isinstance(e.orig, AsyncAdapt_asyncpg_dbapi.InvalidCachedStatementError):
+            raise
+        return await run()
+
+
+def validate_table_name(schema_name: str, table_name: str) -> None:
+    """
+    Check that the schema and table names are plain identifiers.
+
+    Args:
+        schema_name: Schema name
+        table_name: Table name
+
+    Raises:
+        InvalidQueryError: If either name isn't a plain identifier
+    """
+    for name in (schema_name, table_name):
+        if not _IDENT_RE.fullmatch(name):
+            raise InvalidQueryError(f"Invalid identifier '{name}'")
+
+
+def clear_metadata_cache() -> None:
+    """Forget all cached table metadata."""
+    _metadata_cache.clear()
+
+
+async def get_table_metadata(
+    engine: AsyncEngine, schema_name: str, table_name: str
+) -> Optional[TableMetadata]:
     """
     Get column information for a specific table from information_schema.
 
+    Results, along with the lookups derived from them, are cached for five
+    minutes per (schema, table).
+
     Args:
-        engine: SQLAlchemy engine
+        engine: Async SQLAlchemy engine
         schema_name: Schema name
         table_name: Table name
 
     Returns:
-        List of column information dictionaries
-    """
-    query = sa.text(
-        """
-        SELECT column_name, data_type, is_nullable
-        FROM information_schema.columns
-        WHERE table_schema = :schema_name AND table_name = :table_name
-        ORDER BY ordinal_position
-        """
-    )
+        Table metadata, or None if the table doesn't exist
+    """
+    cache_key = (schema_name, table_name)
+    cached = _metadata_cache.get(cache_key)
+    if cached is not None:
+        return cached
 
     try:
-        with engine.connect() as conn:
-            result = conn.execute(
-                query, {"schema_name": schema_name, "table_name": table_name}
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                _COLUMNS_QUERY, {"schema_name": schema_name, "table_name": table_name}
             )
-            columns = [
-                {
-                    "name": row[0],
-                    "type": row[1],
-                    "nullable": row[2] == "YES",
-                }
-                for row in result
-            ]
-            return columns
+            rows = result.all()
     except SQLAlchemyError as e:
         raise ValueError(f"Error fetching column information: {str(e)}")
 
+    if not rows:
+        return None
+    columns = tuple(
+        {
+            "name": row[0],
+            "type": row[1],
+            "nullable": row[2] == "YES",
+        }
+        for row in rows
+    )
+    column_types = {col["name"]: col["type"] for col in columns}
+    # Quoted type names to cast cursor values to, e.g. "pg_catalog"."int4"
+    cast_types = {
+        row[0]: '"{}"."{}"'.format(*(name.replace('"', '""') for name in row[3:5]))
+        for row in rows
+    }
+    table = TableMetadata(columns, column_types, cast_types, "district" in column_types)
+    _metadata_cache[cache_key] = table
+    return table
+
+
+def _cursor_tag(data: bytes) -> bytes:
+    """Sign cursor token data with the configured cursor secret."""
+    secret = config.api.cursor_secret.encode()
+    return hmac.new(secret, data, hashlib.sha256).digest()[:_CURSOR_TAG_SIZE]
+
+
+def _encode_cursor(payload: Dict[str, Any]) -> str:
+    """
+    Encode a keyset cursor as an opaque, signed token.
+
+    Args:
+        payload: Cursor contents (table, sort column and last key)
+
+    Returns:
+        URL-safe base64 token of the JSON payload followed by its HMAC tag
+    """
+    data = orjson.dumps(payload, default=str)
+    token = base64.urlsafe_b64encode(data + _cursor_tag(data))
+    return token.rstrip(b"=").decode()
+
 
-def check_table_exists(engine: Engine, schema_name: str, table_name: str) -> bool:
+def _decode_cursor(token: str) -> Dict[str, Any]:
     """
-    Check if a table exists in the database.
+    Decode and verify a cursor token made by _encode_cursor.
+
+    Args:
+        token: Token as received from the client
+
+    Returns:
+        The cursor payload
+
+    Raises:
+        InvalidQueryError: If the token is malformed or its signature is wrong
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except ValueError:
+        raise InvalidQueryError("Invalid cursor")
+    data, tag = raw[:-_CURSOR_TAG_SIZE], raw[-_CURSOR_TAG_SIZE:]
+    if len(raw) <= _CURSOR_TAG_SIZE or not hmac.compare_digest(tag, _cursor_tag(data)):
+        raise InvalidQueryError("Invalid cursor")
+    try:
+        payload = orjson.loads(data)
+    except orjson.JSONDecodeError:
+        raise InvalidQueryError("Invalid cursor")
+    if not isinstance(payload, dict):
+        raise InvalidQueryError("Invalid cursor")
+    return payload
+
+
+@lru_cache(maxsize=1024)
+def _build_queries(
+    schema_name: str,
+    table_name: str,
+    pagination_column: str,
+    district_type: Optional[str],
+    cursor_type: Optional[str],
+    fields: Tuple[str, ...] = (),
+) -> Tuple[sa.TextClause, sa.TextClause]:
+    """
+    Validate identifiers and build the data and count statements for one
+    query shape.
+
+    Statements are memoized so repeated requests for the same table skip
+    validation, reuse the same objects and hit SQLAlchemy's compiled cache;
+    the identical SQL text also lets asyncpg reuse its prepared statements.
 
     Args:
-        engine: SQLAlchemy engine
         schema_name: Schema name
         table_name: Table name
+        pagination_column: Column to order and seek by
+        district_type: Quoted type of the district column when filtering
+            on :district
+        cursor_type: Quoted type of the pagination column when seeking
+            past :cursor instead of using :offset
+        fields: Columns to select, or empty to select all columns
 
     Returns:
-        True if the table exists, False otherwise
-    """
-    query = sa.text(
-        """
-        SELECT EXISTS (
-            SELECT 1
-            FROM information_schema.tables
-            WHERE table_schema = :schema_name AND table_name = :table_name
+        Tuple of (data statement, count statement)
+
+    Raises:
+        InvalidQueryError: If the schema or table name isn't a plain identifier
+        ValueError: If the pagination column isn't a plain identifier
+    """
+    # Names are interpolated into SQL, so only accept plain identifiers
+    validate_table_name(schema_name, table_name)
+    if not _IDENT_RE.fullmatch(pagination_column):
+        raise ValueError(f"Invalid pagination column '{pagination_column}'")
+
+    # Build the base query
+    projection = ", ".join('"' + f.replace('"', '""') + '"' for f in fields) or "*"
+    base_query = f'SELECT {projection} FROM "{schema_name}"."{table_name}"'
+    count_query = f'SELECT COUNT(*) FROM "{schema_name}"."{table_name}"'
+
+    # Values from the query string are bound as text and cast by the
+    # server, since asyncpg doesn't convert text parameters to other types
+    where_clause = ""
+    if district_type is not None:
+        where_clause = (
+            f" WHERE district = CAST(CAST(:district AS text) AS {district_type})"
         )
-        """
-    )
 
-    try:
-        with engine.connect() as conn:
-            result = conn.execute(
-                query, {"schema_name": schema_name, "table_name": table_name}
-            )
-            return result.scalar()
-    except SQLAlchemyError as e:
-        raise ValueError(f"Error checking table existence: {str(e)}")
+    # Add pagination, seeking past the cursor when one is given
+    data_where_clause = where_clause
+    if cursor_type is not None:
+        data_where_clause += " AND " if where_clause else " WHERE "
+        data_where_clause += (
+            f'"{pagination_column}" > CAST(CAST(:cursor AS text) AS {cursor_type})'
+        )
+        pagination = f' ORDER BY "{pagination_column}" LIMIT :limit'
+    else:
+        pagination = f' ORDER BY "{pagination_column}" LIMIT :limit OFFSET :offset'
+
+    # Complete queries
+    data_query = base_query + data_where_clause + pagination
+    count_query = count_query + where_clause
+
+    return sa.text(data_query), sa.text(count_query)
+
 
+def select_fields(table: TableMetadata, fields: Optional[str]) -> Tuple[str, ...]:
+    """
+    Resolve a comma-separated list of requested columns.
+
+    The pagination column is always selected so keyset pagination keeps
+    working.
 
-def query_table_data(
-    engine: Engine,
+    Args:
+        table: Table metadata from get_table_metadata
+        fields: Comma-separated column names, or None for all columns
+
+    Returns:
+        Tuple of column names to select, or an empty tuple for all columns
+
+    Raises:
+        InvalidQueryError: If a requested column doesn't exist in the table
+    """
+    names = [name.strip() for name in (fields or "").split(",") if name.strip()]
+    if not names:
+        return ()
+
+    for name in names:
+        if name not in table.column_types:
+            raise InvalidQueryError(f"Unknown field '{name}'")
+    names.append(config.db.pagination_column)
+    return tuple(dict.fromkeys(names))
+
+
+def _prepare_query(
     schema_name: str,
     table_name: str,
-    columns: List[Dict[str, Any]],
-    district_filter: Optional[str] = None,
-    page: int = 1,
-    page_size: int = 100,
-) -> Tuple[List[Dict[str, Any]], int]:
+    table: TableMetadata,
+    district_filter: Optional[str],
+    page: int,
+    page_size: int,
+    cursor: Optional[str],
+    fields: Tuple[str, ...],
+) -> Tuple[sa.TextClause, sa.TextClause, Dict[str, Any]]:
     """
-    Query data from a table with pagination and optional district filter.
+    Pick the data and count statements and bind parameters for a request.
 
     Args:
-        engine: SQLAlchemy engine
         schema_name: Schema name
         table_name: Table name
-        columns: List of column information dictionaries
+        table: Table metadata from get_table_metadata
         district_filter: Optional district filter value
         page: Page number (1-based)
         page_size: Number of items per page
+        cursor: Optional cursor token from a previous page
+        fields: Columns to select from select_fields
 
     Returns:
-        Tuple of (list of row dictionaries, total count)
-    """
-    # Check if district column exists
-    column_names = [col["name"] for col in columns]
-    has_district = "district" in column_names
+        Tuple of (data statement, count statement, bind parameters)
 
+    Raises:
+        InvalidQueryError: If the schema or table name isn't a plain identifier
+        InvalidQueryError: If the cursor is invalid or was issued for another
+            table or pagination column
+        ValueError: If the pagination column is invalid or missing
+    """
     # Get pagination column
     pagination_column = config.db.pagination_column
-    if pagination_column not in column_names:
+    if pagination_column not in table.column_types:
         raise ValueError(
             f"Pagination column '{pagination_column}' not found in table columns"
         )
-
-    # Build the base query
-    base_query = f'SELECT * FROM "{schema_name}"."{table_name}"'
-    count_query = f'SELECT COUNT(*) FROM "{schema_name}"."{table_name}"'
+    if cursor is not None:
+        payload = _decode_cursor(cursor)
+        if (
+            payload.get("table") != f"{schema_name}.{table_name}"
+            or payload.get("sort") != pagination_column
+            or payload.get("last_id") is None
+        ):
+            raise InvalidQueryError("Cursor doesn't match this table")
+        cursor = payload["last_id"]
 
     # Add district filter if provided and column exists
-    where_clause = ""
     params = {}
-    if district_filter and has_district:
-        where_clause = " WHERE district = :district"
+    if district_filter and table.has_district:
         params["district"] = district_filter
 
-    # Add pagination
-    offset = (page - 1) * page_size
-    pagination = f" ORDER BY {pagination_column} LIMIT :limit OFFSET :offset"
-    params.update({"limit": page_size, "offset": offset})
+    # Add pagination, seeking past the cursor when one is given
+    if cursor is not None:
+        params.update({"cursor": str(cursor), "limit": page_size})
+    else:
+        params.update({"limit": page_size, "offset": (page - 1) * page_size})
 
-    # Complete queries
-    data_query = base_query + where_clause + pagination
-    count_query = count_query + where_clause
+    data_query, count_query = _build_queries(
+        schema_name,
+        table_name,
+        pagination_column,
+        table.cast_types["district"] if "district" in params else None,
+        table.cast_types[pagination_column] if cursor is not None else None,
+        fields,
+    )
+    return data_query, count_query, params
+
+
+async def query_table_data(
+    engine: AsyncEngine,
+    schema_name: str,
+    table_name: str,
+    table: TableMetadata,
+    district_filter: Optional[str] = None,
+    page: int = 1,
+    page_size: int = 100,
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    exact_count: bool = False,
+    fields: Tuple[str, ...] = (),
+) -> Tuple[List[Dict[str, Any]], Optional[int], Optional[str]]:
+    """
+    Query data from a table with pagination and optional district filter.
+
+    When `cursor` is given, keyset pagination is used instead of OFFSET:
+    only rows after the position encoded in the cursor are returned and
+    `page` is ignored. Cursors are opaque tokens signed with the cursor
+    secret and bound to the schema, table and pagination column; a token
+    for anything else is rejected. A next cursor is returned for every full
+    page, so the server keeps no pagination state.
+
+    The total row count costs a full scan of the (filtered) table, so it is
+    only computed when `include_total` is set, and is reused for a minute
+    per (schema, table, district). Without a district filter the planner's
+    row estimate from pg_class is returned instead, unless `exact_count` is
+    set or the table has never been analyzed. The count runs on its own
+    connection, concurrently with the data query.
+
+    Args:
+        engine: Async SQLAlchemy engine
+        schema_name: Schema name
+        table_name: Table name
+        table: Table metadata from get_table_metadata
+        district_filter: Optional district filter value
+        page: Page number (1-based)
+        page_size: Number of items per page
+        cursor: Optional cursor token from a previous page
+        include_total: Whether to compute the total row count
+        exact_count: Whether to always count rows instead of estimating
+        fields: Columns to select from select_fields; empty selects all
+
+    Returns:
+        Tuple of (list of row dictionaries, total count or None, next cursor
+        token or None)
+
+    Raises:
+        InvalidQueryError: If the cursor is invalid or was issued for another
+            table or pagination column
+    """
+    data_query, count_query, params = _prepare_query(
+        schema_name,
+        table_name,
+        table,
+        district_filter,
+        page,
+        page_size,
+        cursor,
+        fields,
+    )
+    estimate_count = not exact_count and "district" not in params
+    count_key = (schema_name, table_name, params.get("district"), estimate_count)
+
+    async def count_rows() -> int:
+        async with engine.connect() as conn:
+            if estimate_count:
+                estimate_result = await conn.execute(
+                    _ESTIMATE_QUERY,
+                    {"table_name": f'"{schema_name}"."{table_name}"'},
+                )
+                estimate = estimate_result.scalar()
+                # Tables that were never analyzed report -1 (or 0)
+                if estimate is not None and estimate > 0:
+                    return estimate
+            count_result = await conn.execute(count_query, params)
+            return count_result.scalar()
+
+    async def fetch_rows() -> List[Dict[str, Any]]:
+        async with engine.connect() as conn:
+            result = await conn.execute(data_query, params)
+            return [dict(row) for row in result.mappings()]
 
     try:
-        with engine.connect() as conn:
-            # Get total count
-            count_result = conn.execute(sa.text(count_query), params)
-            total_count = count_result.scalar()
-
-            # Get paginated data
-            result = conn.execute(sa.text(data_query), params)
-            rows = []
-            for row in result:
-                row_dict = {}
-                for i, col in enumerate(result.keys()):
-                    row_dict[col] = row[i]
-                rows.append(row_dict)
-
-            return rows, total_count
+        # Get total count, reusing a recent one when available; otherwise
+        # count on a second connection while the page is being fetched
+        total_count = _count_cache.get(count_key) if include_total else None
+        if include_total and total_count is None:
+            total_count, rows = await asyncio.gather(
+                _retry_stale(count_rows), _retry_stale(fetch_rows)
+            )
+            _count_cache[count_key] = total_count
+        else:
+            rows = await _retry_stale(fetch_rows)
     except SQLAlchemyError as e:
         raise ValueError(f"Error querying table data: {str(e)}")
+
+    # Only a full page can be followed by more rows
+    pagination_column = config.db.pagination_column
+    next_cursor = None
+    if rows and len(rows) == page_size:
+        next_cursor = _encode_cursor(
+            {
+                "table": f"{schema_name}.{table_name}",
+                "sort": pagination_column,
+                "last_id": rows[-1][pagination_column],
+            }
+        )
+    return rows, total_count, next_cursor
+
+
+async def stream_table_data(
+    engine: AsyncEngine,
+    schema_name: str,
+    table_name: str,
+    table: TableMetadata,
+    district_filter: Optional[str] = None,
+    page: int = 1,
+    page_size: int = 100,
+    cursor: Optional[str] = None,
+    fields: Tuple[str, ...] = (),
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Stream a page of table data from a server-side cursor.
+
+    The query is run and its first batch fetched before returning, so
+    errors surface before a response is started; the remaining rows are
+    fetched in batches of 200 as the returned iterator is consumed, so the
+    page is never held in memory at once.
+
+    Args:
+        engine: Async SQLAlchemy engine
+        schema_name: Schema name
+        table_name: Table name
+        table: Table metadata from get_table_metadata
+        district_filter: Optional district filter value
+        page: Page number (1-based)
+        page_size: Number of items per page
+        cursor: Optional cursor token from a previous page
+        fields: Columns to select from select_fields; empty selects all
+
+    Returns:
+        Async iterator over batches of row dictionaries
+
+    Raises:
+        InvalidQueryError: If the cursor is invalid or was issued for another
+            table or pagination column
+        ValueError: If the query fails
+    """
+    data_query, _, params = _prepare_query(
+        schema_name,
+        table_name,
+        table,
+        district_filter,
+        page,
+        page_size,
+        cursor,
+        fields,
+    )
+
+    async def partitions() -> AsyncIterator[List[Dict[str, Any]]]:
+        async with engine.connect() as conn:
+            result = await conn.stream(
+                data_query, params, execution_options={"yield_per": 200}
+            )
+            async for partition in result.mappings().partitions():
+                yield [dict(row) for row in partition]
+
+    # Start the query now; the started generator keeps the connection open
+    # and releases it when exhausted or closed
+    async def start() -> Tuple[AsyncIterator[List[Dict[str, Any]]], Any]:
+        stream = partitions()
+        return stream, await anext(stream, None)
+
+    try:
+        stream, first = await _retry_stale(start)
+    except SQLAlchemyError as e:
+        raise ValueError(f"Error streaming table data: {str(e)}")
+
+    async def batches() -> AsyncIterator[List[Dict[str, Any]]]:
+        try:
+            if first is not None:
+                yield first
+                async for batch in stream:
+                    yield batch
+        except SQLAlchemyError as e:
+            raise ValueError(f"Error streaming table data: {str(e)}")
+        finally:
+            await stream.aclose()
+
+    return batches()
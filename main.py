@@ -1,64 +1,91 @@
-from typing import Optional
-from fastapi import FastAPI, Depends, HTTPException, Query, Security, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.middleware.cors import CORSMiddleware
+import logging
+import zlib
+from typing import Any, Optional
+from cachetools import TTLCache
+from fastapi import FastAPI, HTTPException, Query, Response, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import orjson
+from pydantic_core import to_jsonable_python
 import uvicorn
 
 from config import config
 from database import (
+    InvalidQueryError,
     get_db_engine,
-    get_table_columns,
-    check_table_exists,
+    get_table_metadata,
+    clear_metadata_cache,
     query_table_data,
+    select_fields,
+    stream_table_data,
+    validate_table_name,
+    warm_db_pool,
 )
-from models import TableDataResponse, ColumnInfo, PaginationMetadata, ErrorResponse
+from middleware import AllowAllCORSMiddleware, BearerAuthMiddleware
+from models import TableDataResponse, ErrorResponse
+
+logger = logging.getLogger(__name__)
+
+# Compressed /api/data response bodies keyed by the request's query
+# parameters; the size limit is in bytes
+_response_cache: TTLCache = TTLCache(
+    maxsize=config.api.response_cache_max_bytes,
+    ttl=max(config.api.response_cache_ttl, 1),
+    getsizeof=len,
+)
+
+
+class DataJSONResponse(ORJSONResponse):
+    """
+    orjson response that also encodes values orjson doesn't support natively
+    (e.g. Decimal) the same way Pydantic would, and writes UTC datetimes
+    with a "Z" suffix as Pydantic does.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=to_jsonable_python,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z,
+        )
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Warehouse API",
     description="API for querying PostgreSQL warehouse data",
     version="1.0.0",
+    default_response_class=DataJSONResponse,
 )
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Require a Bearer token on /api/ routes
+app.add_middleware(BearerAuthMiddleware, token=config.api.token)
 
-# Security
-security = HTTPBearer()
+# Allow cross-origin requests (added last so it wraps auth and answers
+# preflights)
+app.add_middleware(AllowAllCORSMiddleware)
 
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Security(security)):
-    """
-    Verify the Bearer token.
+@app.on_event("startup")
+async def warm_up_database():
+    """Reset cached table metadata and open a few pooled database connections."""
+    clear_metadata_cache()
+    try:
+        await warm_db_pool(config.db.pool_min_size)
+    except ValueError as e:
+        logger.warning(str(e))
 
-    Args:
-        credentials: Bearer token credentials
 
-    Returns:
-        True if token is valid
-
-    Raises:
-        HTTPException: If token is invalid
-    """
-    if credentials.credentials != config.api.token:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication token",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    return True
+@app.on_event("shutdown")
+async def close_database():
+    """Close all pooled database connections."""
+    await get_db_engine().dispose()
 
 
 @app.get(
     "/api/data",
     response_model=TableDataResponse,
     responses={
+        400: {"model": ErrorResponse},
         401: {"model": ErrorResponse},
         404: {"model": ErrorResponse},
         500: {"model": ErrorResponse},
@@ -70,67 +97,127 @@ async def get_table_data(
     district: Optional[str] = Query(None, description="Optional district filter"),
     page: int = Query(1, description="Page number (1-based)", ge=1),
     page_size: int = Query(100, description="Number of items per page", ge=1, le=1000),
-    authenticated: bool = Depends(verify_token),
+    cursor: Optional[str] = Query(
+        None, description="next_cursor token from a previous page; overrides page"
+    ),
+    include_total: bool = Query(
+        False, description="Include the total item and page counts"
+    ),
+    exact_count: bool = Query(
+        False, description="Count rows exactly instead of using an estimate"
+    ),
+    fields: Optional[str] = Query(
+        None, description="Comma-separated columns to return; defaults to all"
+    ),
 ):
     """
     Get paginated data from a PostgreSQL table with optional district filtering.
 
+    Passing the `next_cursor` of a previous response as `cursor` switches to
+    keyset pagination, which stays fast on deep pages; `page` is then ignored.
+    Cursors are signed tokens bound to the table, so tampered or foreign
+    cursors are rejected with 400.
+    Total counts require a full scan and are only returned with `include_total`;
+    unfiltered counts are estimated unless `exact_count` is set. Responses are
+    cached for `RESPONSE_CACHE_TTL` seconds.
+
     Args:
         schema_name: PostgreSQL schema name
         table_name: Table name
         district: Optional district filter
         page: Page number (1-based)
         page_size: Number of items per page
-        authenticated: Authentication dependency
+        cursor: Optional next_cursor token from a previous page
+        include_total: Whether to include total item and page counts
+        exact_count: Whether to count rows exactly instead of estimating
+        fields: Optional comma-separated columns to return
 
     Returns:
-        TableDataResponse with data, columns, and pagination metadata
+        JSON response shaped like TableDataResponse
 
     Raises:
         HTTPException: If table doesn't exist or other errors occur
     """
+    cache_key = (
+        schema_name,
+        table_name,
+        district,
+        page,
+        page_size,
+        cursor,
+        include_total,
+        exact_count,
+        fields,
+    )
+    cached = _response_cache.get(cache_key)
+    if cached is not None:
+        return Response(zlib.decompress(cached), media_type="application/json")
+
     try:
+        # Reject names that can't be tables before looking them up
+        validate_table_name(schema_name, table_name)
         engine = get_db_engine()
 
-        # Check if table exists
-        if not check_table_exists(engine, schema_name, table_name):
+        # Get column information; None means the table doesn't exist
+        table = await get_table_metadata(engine, schema_name, table_name)
+        if table is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Table '{schema_name}.{table_name}' not found",
             )
 
-        # Get column information
-        columns = get_table_columns(engine, schema_name, table_name)
-        if not columns:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"No columns found for table '{schema_name}.{table_name}'",
-            )
+        # Narrow the columns to the requested fields
+        selected = select_fields(table, fields)
+        columns = table.columns
+        if selected:
+            columns = [col for col in columns if col["name"] in selected]
 
         # Query table data with pagination and optional district filter
-        rows, total_count = query_table_data(
+        rows, total_count, next_cursor = await query_table_data(
             engine,
             schema_name,
             table_name,
-            columns,
+            table,
             district_filter=district,
             page=page,
             page_size=page_size,
+            cursor=cursor,
+            include_total=include_total,
+            exact_count=exact_count,
+            fields=selected,
         )
 
         # Calculate total pages
-        total_pages = (total_count + page_size - 1) // page_size
-
-        # Create response
-        return TableDataResponse(
-            data=rows,
-            columns=[ColumnInfo(**col) for col in columns],
-            pagination=PaginationMetadata(
-                total_items=total_count,
-                page=page,
-                page_size=page_size,
-                total_pages=total_pages,
-            ),
+        total_pages = None
+        if total_count is not None:
+            total_pages = (total_count + page_size - 1) // page_size
+
+        # Create response; returning the response directly skips validating
+        # every row against TableDataResponse, which only documents the shape
+        response = DataJSONResponse(
+            {
+                "data": rows,
+                "columns": columns,
+                "pagination": {
+                    "total_items": total_count,
+                    "page": page,
+                    "page_size": page_size,
+                    "total_pages": total_pages,
+                    "next_cursor": next_cursor,
+                },
+            }
+        )
+        if config.api.response_cache_ttl > 0:
+            compressed = zlib.compress(response.body, 1)
+            if len(compressed) <= _response_cache.maxsize:
+                _response_cache[cache_key] = compressed
+        return response
+    except HTTPException:
+        raise
+    except InvalidQueryError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
         )
     except ValueError as e:
         raise HTTPException(
@@ -144,6 +231,109 @@ async def get_table_data(
         )
 
 
+@app.get(
+    "/api/data/stream",
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {"application/x-ndjson": {}}},
+        400: {"model": ErrorResponse},
+        401: {"model": ErrorResponse},
+        404: {"model": ErrorResponse},
+        500: {"model": ErrorResponse},
+    },
+)
+async def stream_data(
+    schema_name: str = Query(..., description="PostgreSQL schema name"),
+    table_name: str = Query(..., description="Table name"),
+    district: Optional[str] = Query(None, description="Optional district filter"),
+    page: int = Query(1, description="Page number (1-based)", ge=1),
+    page_size: int = Query(100, description="Number of items per page", ge=1, le=1000),
+    cursor: Optional[str] = Query(
+        None, description="next_cursor token from /api/data; overrides page"
+    ),
+    fields: Optional[str] = Query(
+        None, description="Comma-separated columns to return; defaults to all"
+    ),
+):
+    """
+    Stream a page of table data as newline-delimited JSON, one row per line.
+
+    Rows are sent as they are read from the database instead of being
+    collected into a single response, which keeps memory flat for large
+    pages. `cursor` takes the same signed tokens as /api/data; tampered or
+    foreign cursors are rejected with 400.
+
+    Args:
+        schema_name: PostgreSQL schema name
+        table_name: Table name
+        district: Optional district filter
+        page: Page number (1-based)
+        page_size: Number of items per page
+        cursor: Optional next_cursor token from /api/data
+        fields: Optional comma-separated columns to return
+
+    Returns:
+        StreamingResponse with one JSON object per row
+
+    Raises:
+        HTTPException: If table doesn't exist or other errors occur
+    """
+    try:
+        # Reject names that can't be tables before looking them up
+        validate_table_name(schema_name, table_name)
+        engine = get_db_engine()
+
+        # Get column information; None means the table doesn't exist
+        table = await get_table_metadata(engine, schema_name, table_name)
+        if table is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Table '{schema_name}.{table_name}' not found",
+            )
+
+        batches = await stream_table_data(
+            engine,
+            schema_name,
+            table_name,
+            table,
+            district_filter=district,
+            page=page,
+            page_size=page_size,
+            cursor=cursor,
+            fields=select_fields(table, fields),
+        )
+    except HTTPException:
+        raise
+    except InvalidQueryError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e),
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An unexpected error occurred: {str(e)}",
+        )
+
+    async def ndjson():
+        async for batch in batches:
+            yield b"".join(
+                orjson.dumps(
+                    row,
+                    default=to_jsonable_python,
+                    option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_UTC_Z,
+                )
+                for row in batch
+            )
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
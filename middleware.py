@@ -0,0 +1,126 @@
+import hmac
+import json
+from typing import Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class BearerAuthMiddleware:
+    """
+    ASGI middleware that rejects API requests without a valid Bearer token.
+
+    The token is checked against the raw `Authorization` header so requests
+    don't go through FastAPI's dependency injection just to be authenticated.
+    """
+
+    def __init__(self, app: ASGIApp, token: str, path_prefix: str = "/api/"):
+        """
+        Args:
+            app: The ASGI application to wrap
+            token: Expected Bearer token
+            path_prefix: Only paths starting with this prefix are protected
+        """
+        self.app = app
+        self.token = token.encode()
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or not scope["path"].startswith(self.path_prefix)
+            or self._is_authorized(scope)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        body = json.dumps({"detail": "Invalid authentication token"}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 401,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"www-authenticate", b"Bearer"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    def _is_authorized(self, scope: Scope) -> bool:
+        """Check the request's Authorization header against the expected token."""
+        if not self.token:
+            return False
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                scheme, _, credentials = value.partition(b" ")
+                return scheme.lower() == b"bearer" and hmac.compare_digest(
+                    credentials.strip(), self.token
+                )
+        return False
+
+
+class AllowAllCORSMiddleware:
+    """
+    ASGI middleware that allows cross-origin requests from any origin.
+
+    Preflight requests are answered directly with a static response, and
+    other cross-origin responses only get an `access-control-allow-origin: *`
+    header added. Requests without an `Origin` header pass straight through.
+    """
+
+    ALLOW_METHODS = b"DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"
+    MAX_AGE = b"600"
+
+    def __init__(self, app: ASGIApp):
+        """
+        Args:
+            app: The ASGI application to wrap
+        """
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        has_origin = False
+        request_method = None
+        request_headers = None
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                has_origin = True
+            elif name == b"access-control-request-method":
+                request_method = value
+            elif name == b"access-control-request-headers":
+                request_headers = value
+
+        if not has_origin:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS" and request_method is not None:
+            await self._preflight(send, request_headers)
+            return
+
+        async def send_with_cors(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"access-control-allow-origin", b"*")
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+    async def _preflight(self, send: Send, request_headers: Optional[bytes]) -> None:
+        """Answer a CORS preflight request, allowing any method and headers."""
+        headers = [
+            (b"access-control-allow-origin", b"*"),
+            (b"access-control-allow-methods", self.ALLOW_METHODS),
+            (b"access-control-max-age", self.MAX_AGE),
+            (b"content-length", b"0"),
+        ]
+        if request_headers:
+            headers.append((b"access-control-allow-headers", request_headers))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
@@ -5,10 +5,19 @@ from pydantic import BaseModel, Field
 class PaginationMetadata(BaseModel):
     """Pagination metadata for API responses."""
 
-    total_items: int = Field(..., description="Total number of items")
+    total_items: Optional[int] = Field(
+        None, description="Total number of items, if requested with include_total"
+    )
     page: int = Field(..., description="Current page number")
     page_size: int = Field(..., description="Number of items per page")
-    total_pages: int = Field(..., description="Total number of pages")
+    total_pages: Optional[int] = Field(
+        None, description="Total number of pages, if requested with include_total"
+    )
+    next_cursor: Optional[str] = Field(
+        None,
+        description="Opaque token to pass as `cursor` to fetch the next page; "
+        "only set when the page is full",
+    )
 
 
 class TableQueryParams(BaseModel):
@@ -19,6 +28,18 @@ class TableQueryParams(BaseModel):
     district: Optional[str] = Field(None, description="Optional district filter")
     page: int = Field(1, description="Page number (1-based)", ge=1)
     page_size: int = Field(100, description="Number of items per page", ge=1, le=1000)
+    cursor: Optional[str] = Field(
+        None, description="next_cursor token from a previous page; overrides page"
+    )
+    include_total: bool = Field(
+        False, description="Include the total item and page counts"
+    )
+    exact_count: bool = Field(
+        False, description="Count rows exactly instead of using an estimate"
+    )
+    fields: Optional[str] = Field(
+        None, description="Comma-separated columns to return; defaults to all"
+    )
 
 
 class ColumnInfo(BaseModel):